@@ -2,6 +2,7 @@
 @author: Joseph A.
 Description: Prediction script for sales forecasting.
 """
+import numpy as np
 import pandas as pd
 from src.configs.config import (
     DATE_COL, TARGET_COL, KEY_COLS,
@@ -9,7 +10,7 @@ from src.configs.config import (
     LAGS, ROLLING_WINDOWS, HISTORY_PATH
 )
 from src.data.loader import load_data
-from src.data.preprocessing import encode_data, save_data
+from src.data.preprocessing import encode_data, decode_data, load_encoder, save_data
 from src.features.engineering import build_features
 from src.inference.predictor import load_model, predict
 
@@ -19,34 +20,63 @@ EXCLUDE_COLS = [TARGET_COL, DATE_COL]
 
 def fill_missing_exog(df_new: pd.DataFrame, df_history: pd.DataFrame) -> pd.DataFrame:
     """Fill missing exogenous columns with last known values from history."""
-    df_new = df_new.copy()
-
     # Get exogenous columns from history (exclude date, keys, target, _is_new)
     exog_cols = [c for c in df_history.columns
                 if c not in KEY_COLS + [DATE_COL, TARGET_COL, "_is_new"]]
 
-    # Get last known values per agency/sku
-    df_last = (df_history.sort_values(DATE_COL)
-            .groupby(KEY_COLS)[exog_cols]
-            .last()
-            .reset_index())
+    # Only the exogenous columns absent from new data need filling
+    missing_cols = [c for c in exog_cols if c not in df_new.columns]
+    if not missing_cols:
+        return df_new
 
-    # Fill missing columns in new data
-    for col in exog_cols:
-        if col not in df_new.columns:
-            df_new = df_new.merge(df_last[KEY_COLS + [col]], on=KEY_COLS, how="left")
+    # Last known values per agency/sku (history is sorted by keys + date)
+    df_last = (df_history
+            .groupby(KEY_COLS, sort=False, observed=True)[missing_cols]
+            .last())
+    df_last = df_last.reindex(pd.MultiIndex.from_frame(df_new[KEY_COLS]))
+    for col in missing_cols:
+        df_new[col] = df_last[col].to_numpy()
 
     return df_new
 
+def filter_history(df_history: pd.DataFrame, df_new: pd.DataFrame) -> pd.DataFrame:
+    """Keep only the history of the agency/sku pairs present in new data.
+
+    Row order (sorted by keys + date) is preserved.
+    """
+    history_keys = pd.MultiIndex.from_frame(df_history[KEY_COLS])
+    new_keys = pd.MultiIndex.from_frame(df_new[KEY_COLS].drop_duplicates())
+    return df_history.take(np.flatnonzero(history_keys.isin(new_keys)))
+
+def merge_sorted(df_history: pd.DataFrame, df_new: pd.DataFrame) -> pd.DataFrame:
+    """Union of two frames already sorted by keys + date, keeping that order."""
+    # Align categories (in place) so concat keeps the keys categorical
+    for col in KEY_COLS:
+        if (isinstance(df_history[col].dtype, pd.CategoricalDtype)
+                and isinstance(df_new[col].dtype, pd.CategoricalDtype)):
+            categories = df_history[col].cat.categories.union(df_new[col].cat.categories)
+            df_history[col] = df_history[col].cat.set_categories(categories)
+            df_new[col] = df_new[col].cat.set_categories(categories)
+    df_combined = pd.concat([df_history, df_new], ignore_index=True)
+
+    group_codes = df_combined.groupby(KEY_COLS, sort=True, observed=True).ngroup().to_numpy()
+    date_codes, dates = pd.factorize(df_combined[DATE_COL], sort=True)
+    packed = group_codes.astype(np.int64) * len(dates) + date_codes
+
+    order = np.argsort(packed, kind="stable")
+    return df_combined.take(order).reset_index(drop=True)
+
 def main():
     """Main prediction pipeline."""
     # 1. Load historical data and new data
     print("[1/5] Loading data...")
     df_history = load_data(HISTORY_PATH)
-    df_history[DATE_COL] = pd.to_datetime(df_history[DATE_COL])
 
-    df_new = load_data(PREDICT_DATA_PATH)
-    df_new[DATE_COL] = pd.to_datetime(df_new[DATE_COL])
+    df_new = load_data(PREDICT_DATA_PATH, cache=True)
+    df_new = df_new.sort_values(KEY_COLS + [DATE_COL]).reset_index(drop=True)
+
+    # Restrict history to the series to predict
+    df_history = filter_history(df_history, df_new)
 
     # Mark new data rows for filtering later
     df_history["_is_new"] = False
@@ -59,51 +89,45 @@ def main():
     # Fill missing exogenous columns with last known values
     df_new = fill_missing_exog(df_new, df_history)
 
-    # 2. Concatenate history and new data
+    # 2. Merge history (persisted sorted) and new data
     print("[2/5] Preparing data with history...")
-    df_combined = pd.concat([df_history, df_new], ignore_index=True)
-    df_combined = df_combined.sort_values(KEY_COLS + [DATE_COL]).reset_index(drop=True)
+    df_combined = merge_sorted(df_history, df_new)
 
     # 3. Feature engineering (lags computed from historical volume)
     print("[3/5] Computing features...")
-    df_fe = build_features(df_combined, LAGS, ROLLING_WINDOWS)
-
-    # Filter only new rows (the ones we want to predict)
-    df_predict = df_fe[df_fe["_is_new"]].copy()
+    df_fe = build_features(df_combined, LAGS, ROLLING_WINDOWS, inplace=True)
 
-    # Keep only rows with valid lag features (first horizon has real lags)
+    # Keep only new rows with valid lag features, without the helper columns
     lag_cols = [f"{TARGET_COL}_lag_{lag}" for lag in LAGS]
     rolling_cols = [f"{TARGET_COL}_rolling_mean_{w}" for w in ROLLING_WINDOWS]
     feature_lag_cols = lag_cols + rolling_cols
-    df_predict = df_predict.dropna(subset=feature_lag_cols)
-
-    df_predict = df_predict.drop(columns=["_is_new", TARGET_COL])
+    keep_rows = df_fe["_is_new"].to_numpy() & df_fe[feature_lag_cols].notna().all(axis=1).to_numpy()
+    keep_cols = df_fe.columns.get_indexer(df_fe.columns.drop(["_is_new", TARGET_COL]))
+    df_predict = df_fe.take(np.flatnonzero(keep_rows)).take(keep_cols, axis=1)
 
     if len(df_predict) == 0:
         raise ValueError("No rows to predict after feature engineering.")
 
     # 4. Encode data
     print("[4/5] Encoding data...")
-    encoder = load_model(MODEL_DIR / "encoder.pkl")
-    df_encoded, _ = encode_data(df_predict, encoder)
+    encoder = load_encoder(MODEL_DIR / "encoder.json")
+    df_encoded, encoder = encode_data(df_predict, encoder)
 
     feature_cols = [c for c in df_encoded.columns if c not in EXCLUDE_COLS]
 
     # 5. Load model and predict
     print("[5/5] Generating predictions...")
     model = load_model(MODEL_DIR / "best_model.pkl")
-    df_pred = predict(model, df_encoded, feature_cols)
-
-    # Clip negative predictions to 0
-    df_pred["prediction"] = df_pred["prediction"].clip(lower=0)
+    # Negative predictions are clipped to 0
+    df_pred = predict(model, df_encoded, feature_cols, clip_min=0.0)
 
     # Decode agency/sku back to original names
-    df_pred[KEY_COLS] = encoder.inverse_transform(df_pred[KEY_COLS])
+    df_pred = decode_data(df_pred, encoder)
 
     # Prepare output
     output_cols = [DATE_COL] + KEY_COLS + ["prediction"]
     available_cols = [c for c in output_cols if c in df_pred.columns]
-    df_output = df_pred[available_cols].copy()
+    df_output = df_pred[available_cols]
 
     # Save predictions
     output_path = OUTPUT_DIR / "predictions.csv"
@@ -2,46 +2,87 @@
 @author: Joseph A.
 Description: Main training script.
 """
+import argparse
+import os
 import pandas as pd
+from joblib import Parallel, delayed
 from src.configs.config import (
-    LAGS, ROLLING_WINDOWS, DATE_COL, TARGET_COL,
-    TRAIN_DATA_PATH, MODEL_DIR, PROCESSED_DIR
+    LAGS, ROLLING_WINDOWS, DATE_COL, TARGET_COL, KEY_COLS,
+    TRAIN_DATA_PATH, MODEL_DIR, PROCESSED_DIR, HISTORY_PATH, USE_POLARS,
+    LGB_DATASET_PATH
+)
+from src.data.loader import load_data, scan_data
+from src.data.preprocessing import (
+    preprocess_data, preprocess_data_lazy, encode_data, split_train_test, save_data,
+    to_categorical, save_encoder
 )
-from src.data.loader import load_data
-from src.data.preprocessing import preprocess_data, encode_data, split_train_test, save_data
 from src.features.engineering import build_features
-from src.model.training import train_model, save_model
-from src.model.evaluation import evaluate_model
+from src.model.training import (
+    train_model, build_lgb_dataset, train_lgb_booster, save_model,
+    limit_categorical_levels, HGB_MAX_BINS
+)
+from src.model.evaluation import Metrics, evaluate_model
 
 #pylint: disable=C0103:invalid-name
 
 EXCLUDE_COLS = [TARGET_COL, DATE_COL]
+# All candidates get agency/sku as categoricals (native categorical splits)
+MODEL_CANDIDATES = ["hist_gradient_boosting", "xgboost", "lightgbm"]
 
-def main():
-    """Main training pipeline."
+def fit_and_evaluate(model_name: str, data: tuple, n_jobs: int = -1
+                    ) -> tuple[str, object, Metrics]:
+    """Train one candidate model and evaluate it on the test set.
+    data is the (X_train, y_train, X_test, y_test) tuple.
+    """
+    X_train, y_train, X_test, y_test = data
+    if model_name == "lightgbm":
+        # Binned Dataset cached on disk: reruns on the same data skip binning
+        train_set = build_lgb_dataset(X_train, y_train, KEY_COLS, LGB_DATASET_PATH)
+        model = train_lgb_booster(train_set, n_jobs=n_jobs)
+    elif model_name == "hist_gradient_boosting":
+        # Keys with more levels than bins are passed as integer codes
+        X_train = limit_categorical_levels(X_train, HGB_MAX_BINS)
+        X_test = limit_categorical_levels(X_test, HGB_MAX_BINS)
+        model = train_model(model_name, n_jobs=n_jobs)
+        model.fit(X_train, y_train)
+    else:
+        model = train_model(model_name, n_jobs=n_jobs)
+        model.fit(X_train, y_train)
+    metrics = evaluate_model(model, X_test, y_test, n_jobs=n_jobs)
+    return model_name, model, metrics
+
+def main(save_intermediate: bool = False):
+    """Main training pipeline.
+    Intermediate frames (prepared, train, test) are only written for debugging
+    runs with save_intermediate; history and model artifacts always are.
     """
     # 1. Load & Preprocess Data
-    df_raw = load_data(TRAIN_DATA_PATH)
-    df_prepared = preprocess_data(df_raw)
+    if USE_POLARS:
+        df_prepared = preprocess_data_lazy(scan_data(TRAIN_DATA_PATH))
+    else:
+        df_raw = load_data(TRAIN_DATA_PATH, cache=True)
+        df_prepared = preprocess_data(df_raw)
 
     # Save preprocessed data
-    save_data(df_prepared, PROCESSED_DIR / "df_prepared.csv")
+    if save_intermediate:
+        save_data(df_prepared, PROCESSED_DIR / "df_prepared.parquet")
 
-    # Save recent history (for inference - needed to compute lags)
+    # Save recent history (for inference - needed to compute lags): the last
+    # observations of each agency/sku, kept sorted by keys + date as
+    # predict.py merges new data into it without re-sorting
     max_lag = max(LAGS + ROLLING_WINDOWS)
-    max_date = df_prepared[DATE_COL].max()
-    cutoff_date = max_date - pd.DateOffset(months=max_lag)
-    df_history = df_prepared[df_prepared[DATE_COL] > cutoff_date].copy()
-    save_data(df_history, MODEL_DIR / "history.csv")
+    df_history = df_prepared.groupby(KEY_COLS, sort=False, observed=True).tail(max_lag)
+    save_data(df_history, HISTORY_PATH)
 
     # 2. Feature Engineering
-    df_fe = build_features(df_prepared, LAGS, ROLLING_WINDOWS)
+    df_fe = build_features(df_prepared, LAGS, ROLLING_WINDOWS, inplace=True)
     df_fe = df_fe.dropna()
     train_df, test_df = split_train_test(df_fe, 4)
 
     # Save train and test data
-    save_data(train_df, PROCESSED_DIR / "train.csv")
-    save_data(test_df, PROCESSED_DIR / "test.csv")
+    if save_intermediate:
+        save_data(train_df, PROCESSED_DIR / "train.parquet")
+        save_data(test_df, PROCESSED_DIR / "test.parquet")
 
     # 3. Encode data
     train_df_enc, encoder = encode_data(train_df)
@@ -50,29 +91,34 @@ def main():
     # 4. Define
     feature_cols = [c for c in train_df.columns if c not in EXCLUDE_COLS]
 
-    X_train = train_df_enc[feature_cols].copy()
+    X_train = to_categorical(train_df_enc[feature_cols], encoder)
     y_train = train_df_enc[TARGET_COL]
 
-    X_test = test_df_enc[feature_cols].copy()
+    X_test = to_categorical(test_df_enc[feature_cols], encoder)
     y_test = test_df_enc[TARGET_COL]
 
-    # 5. Model training and comparison
-    MODEL_CANDIDATES = ["random_forest", "xgboost", "lightgbm"]
-
-    results = []
-    models = {}
+    # 5. Model training and comparison (one process per candidate, cores
+    # split between them to avoid oversubscribing the inner thread pools)
+    n_candidates = len(MODEL_CANDIDATES)
+    n_jobs_per_model = max(1, (os.cpu_count() or 1) // n_candidates)
 
+    tasks = []
     for model_name in MODEL_CANDIDATES:
+        # Printed here: output from the worker processes would interleave
         print(f"Training model: {model_name}")
-        model = train_model(model_name)
-        model.fit(X_train, y_train)
-        metrics = evaluate_model(model, X_test, y_test)
+        tasks.append(delayed(fit_and_evaluate)(
+            model_name, (X_train, y_train, X_test, y_test), n_jobs=n_jobs_per_model))
+    fitted = Parallel(n_jobs=n_candidates, backend="loky")(tasks)
+
+    results = []
+    models = {}
 
+    for model_name, model, metrics in fitted:
         results.append({
             'model': model_name,
-            'mae': metrics['mae'],
-            'rmse': metrics['rmse'],
-            'mape': metrics['mape']
+            'mae': metrics.mae,
+            'rmse': metrics.rmse,
+            'mape': metrics.mape
         })
         models[model_name] = model
 
@@ -85,8 +131,12 @@ def main():
     best_model = models[best_model_name]
 
     save_model(best_model, MODEL_DIR / "best_model.pkl")
-    save_model(encoder, MODEL_DIR / "encoder.pkl")
+    save_encoder(encoder, MODEL_DIR / "encoder.json")
     print("Model and encoder saved !")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train and select the forecasting model.")
+    parser.add_argument("--save-intermediate", action="store_true",
+                        help="also save prepared/train/test data to data/processed/")
+    args = parser.parse_args()
+    main(save_intermediate=args.save_intermediate)
@@ -9,13 +9,19 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 TRAIN_DATA_PATH = PROJECT_ROOT / "data" / "raw" / "raw_data.csv"
 PREDICT_DATA_PATH = PROJECT_ROOT / "data" / "raw" / "new_data.csv"
 MODEL_DIR = PROJECT_ROOT / "models"
-HISTORY_PATH = MODEL_DIR / "history.csv"
+HISTORY_PATH = MODEL_DIR / "history.parquet"
 PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
+LGB_DATASET_PATH = PROCESSED_DIR / "train.lgb.bin"
 OUTPUT_DIR = PROJECT_ROOT / "outputs"
+CACHE_DIR = PROJECT_ROOT / "data" / "cache"
+
+# Backend: scan and preprocess training data with Polars (optional dependency)
+USE_POLARS = False
 
 # Data columns
 KEY_COLS = ["agency", "sku"]
 DATE_COL = "date"
+DATE_FORMAT = "%Y-%m-%d"
 TARGET_COL = "volume"
 
 # Feature engineering
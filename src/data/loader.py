@@ -2,11 +2,111 @@
 @author: Joseph A.
 Description: Loader data module
 """
+import hashlib
+import pickle
+from functools import lru_cache
 from pathlib import Path
 import pandas as pd
+from src.configs.config import KEY_COLS, DATE_COL, DATE_FORMAT, TARGET_COL, CACHE_DIR
 
-def load_data(filepath: str | Path) -> pd.DataFrame:
-    """Load data from a CSV file.
+# Known schema for CSV inputs (columns absent from a file are ignored)
+CSV_DTYPES = {**{col: "category" for col in KEY_COLS}, TARGET_COL: "float32"}
+CSV_READ_OPTIONS = {
+    "dtype": CSV_DTYPES,
+    "parse_dates": [DATE_COL],
+    "date_format": DATE_FORMAT,
+    "cache_dates": True,  # monthly data: parse each distinct date once
+    "engine": "c",
+}
+
+@lru_cache(maxsize=16)
+def _read_cached(path: str, mtime_ns: int, reader):
+    """Read a file with reader; cached per (path, modification time)."""
+    del mtime_ns  # cache key only: a rewritten file gets a new entry
+    return reader(path)
+
+def load_cached(filepath: str | Path, reader, what: str = "File"):
+    """Read filepath with reader, cached until the file changes on disk.
+
+    The cached object is shared between callers and must not be modified.
+    """
+    resolved = Path(filepath).resolve()
+    if not resolved.exists():
+        raise FileNotFoundError(f"{what} not found: {filepath}")
+    return _read_cached(str(resolved), resolved.stat().st_mtime_ns, reader)
+
+def _cache_path(filepath: Path) -> Path:
+    """Pickle cache entry of a CSV in CACHE_DIR.
+
+    The name hashes the file (path, size, mtime), the read options and the
+    pandas version, so any change to one of them misses the cache.
+    """
+    stat = filepath.stat()
+    key = repr((str(filepath), stat.st_size, stat.st_mtime_ns,
+                sorted(CSV_READ_OPTIONS.items()), pd.__version__))
+    path_hash = hashlib.sha1(str(filepath).encode()).hexdigest()[:8]
+    key_hash = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return CACHE_DIR / f"{filepath.stem}-{path_hash}-{key_hash}.pkl"
+
+def _write_cache(df: pd.DataFrame, cache_path: Path) -> None:
+    """Write a cache entry and drop older entries of the same file.
+
+    Failures (read-only or full disk) only skip caching.
     """
-    df = pd.read_csv(filepath)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so a concurrent reader never sees a partial pickle
+        tmp = cache_path.with_name(cache_path.name + ".tmp")
+        df.to_pickle(tmp, protocol=5)
+        tmp.replace(cache_path)
+        prefix = cache_path.name.rsplit("-", 1)[0]
+        for old in cache_path.parent.glob(f"{prefix}-*.pkl"):
+            if old != cache_path:
+                old.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+def load_data(filepath: str | Path, cache: bool = False) -> pd.DataFrame:
+    """Load data from a Parquet or CSV file (dispatch on suffix).
+
+    Key columns are returned as categoricals whatever the source, so grouping
+    and joining on them hashes integer codes rather than Python strings.
+    With cache=True, a parsed CSV is pickled to CACHE_DIR and reused while the
+    file, the read options and the pandas version are unchanged.
+    """
+    filepath = Path(filepath)
+    if filepath.suffix == ".parquet":
+        df = pd.read_parquet(filepath, engine="pyarrow")
+        keys = [col for col in KEY_COLS
+                if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype)]
+        if keys:
+            df = df.astype({col: "category" for col in keys})
+        return df
+
+    cache_path = _cache_path(filepath.resolve()) if cache else None
+    if cache_path is not None and cache_path.exists():
+        try:
+            return pd.read_pickle(cache_path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass  # unreadable entry: parse the CSV and rewrite it
+
+    df = pd.read_csv(filepath, **CSV_READ_OPTIONS)
+    if cache_path is not None:
+        _write_cache(df, cache_path)
     return df
+
+def scan_data(filepath: str | Path):
+    """Lazily scan a Parquet or CSV file with Polars (dispatch on suffix).
+    """
+    # optional dependency, only needed when USE_POLARS
+    import polars as pl  # pylint: disable=import-outside-toplevel
+
+    filepath = Path(filepath)
+    if filepath.suffix == ".parquet":
+        return pl.scan_parquet(filepath)
+    lf = pl.scan_csv(filepath,
+                    schema_overrides={TARGET_COL: pl.Float32, DATE_COL: pl.Date})
+    # Match pandas naming of an unnamed index column
+    if "" in lf.collect_schema():
+        lf = lf.rename({"": "Unnamed: 0"})
+    return lf
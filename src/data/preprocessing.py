@@ -2,22 +2,67 @@
 @author: Joseph A.
 Description: Data preparation module
 """
+import json
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import OrdinalEncoder
 from src.configs.config import KEY_COLS, DATE_COL, TARGET_COL
+from src.data.loader import load_cached
 
 DROP_COLS = ["Unnamed: 0", "timeseries"]
+PROBE_ROWS = 1024
 
-def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Clean and preprocess raw data."""
-    df = df.copy()
+def _is_constant(series: pd.Series) -> bool:
+    """Check whether a column holds a single value (NaN counts as a value).
+
+    Values are compared to the first one, probing a head slice before the
+    full column so that varying columns exit early without any hashing.
+    """
+    if len(series) <= 1:
+        return True
+    first = series.iloc[0]
+    if pd.isna(first):
+        return bool(series.isna().all())
+    if not series.iloc[:PROBE_ROWS].eq(first).all():
+        return False
+    return bool(series.eq(first).all())
+
+def _count_sorted_duplicates(df: pd.DataFrame, cols: list[str]) -> int:
+    """Count rows equal to their predecessor on cols, df being sorted on cols.
+
+    Duplicates are adjacent once sorted, so one linear pass per column
+    replaces the multi-column hashing of df.duplicated.
+    """
+    same = np.ones(max(len(df) - 1, 0), dtype=bool)
+    for col in cols:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.cat.codes
+        values = values.to_numpy()
+        missing = pd.isna(values)
+        # NaN/NaT never compare equal, but df.duplicated treats them as equal
+        same &= (values[1:] == values[:-1]) | (missing[1:] & missing[:-1])
+    return int(same.sum())
 
+def _downcast_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    """Downcast float64 to float32 and int64 to the smallest integer type.
+
+    float32 keeps ~7 significant digits, which is enough for volumes, prices
+    and exogenous values, and halves the memory footprint.
+    """
+    float_cols = df.select_dtypes("float64").columns
+    df[float_cols] = df[float_cols].astype("float32")
+    for col in df.select_dtypes("int64").columns:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    df[TARGET_COL] = df[TARGET_COL].astype("float32")
+    return df
+
+def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
+    """Clean and preprocess raw data (the input frame is left untouched)."""
     df = df.drop(columns=DROP_COLS, errors="ignore")
-    df[DATE_COL] = pd.to_datetime(df[DATE_COL])
     df = df.sort_values(KEY_COLS + [DATE_COL]).reset_index(drop=True)
 
-    constant_cols = df.columns[df.nunique(dropna=False) <= 1]
+    constant_cols = [c for c in df.columns if _is_constant(df[c])]
     df = df.drop(columns=constant_cols)
 
     # Check for missing values in target
@@ -25,44 +70,149 @@ def preprocess_data(df: pd.DataFrame) -> pd.DataFrame:
     if n_missing > 0:
         raise ValueError(f"Found {n_missing} missing values in target.")
 
+    # Check for duplicates (on the frame sorted by keys + date above)
+    duplicates = _count_sorted_duplicates(df, KEY_COLS + [DATE_COL])
+    if duplicates > 0:
+        raise ValueError(f"Found {duplicates} duplicated rows.")
+
+    df = _downcast_numeric(df)
+
+    # Reorder columns: date, keys, target, then exogenous
+    exog_cols = [c for c in df.columns if c not in KEY_COLS + [DATE_COL, TARGET_COL]]
+    ordered_cols = [DATE_COL] + KEY_COLS + [TARGET_COL] + exog_cols
+    return df[ordered_cols]
+
+def preprocess_data_lazy(lf) -> pd.DataFrame:
+    """Clean and preprocess raw data from a Polars LazyFrame.
+
+    Same output as preprocess_data: drop and sort run as one streaming plan,
+    and the frame is converted to pandas only once cleaned.
+    """
+    # optional dependency, only needed when USE_POLARS
+    import polars as pl  # pylint: disable=import-outside-toplevel
+
+    drop_cols = [c for c in DROP_COLS if c in lf.collect_schema()]
+    df = (lf.drop(drop_cols)
+            .sort(KEY_COLS + [DATE_COL])
+            .collect(engine="streaming"))
+
+    constant_cols = [s.name for s in df.iter_columns() if s.n_unique() <= 1]
+    df = df.drop(constant_cols)
+
+    # Check for missing values in target
+    target = df[TARGET_COL]
+    n_missing = target.null_count() + target.is_nan().sum()
+    if n_missing > 0:
+        raise ValueError(f"Found {n_missing} missing values in target.")
+
     # Check for duplicates
-    duplicates = df.duplicated(subset=KEY_COLS + [DATE_COL]).sum()
+    duplicates = df.height - df.select(KEY_COLS + [DATE_COL]).n_unique()
     if duplicates > 0:
         raise ValueError(f"Found {duplicates} duplicated rows.")
 
     # Reorder columns: date, keys, target, then exogenous
     exog_cols = [c for c in df.columns if c not in KEY_COLS + [DATE_COL, TARGET_COL]]
     ordered_cols = [DATE_COL] + KEY_COLS + [TARGET_COL] + exog_cols
-    return df[ordered_cols].copy()
+    df = df.select(ordered_cols).with_columns(pl.col(DATE_COL).cast(pl.Datetime("us")))
+
+    # Convert to pandas at the modelling boundary
+    df = df.to_pandas()
+    df[KEY_COLS] = df[KEY_COLS].astype("category")
+    return _downcast_numeric(df)
 
 def split_train_test(df: pd.DataFrame,
                     n_val_periods: int = 12) -> tuple[pd.DataFrame, pd.DataFrame]:
     """ Split data into train and test sets based on temporal split.
+    Both sets are standalone frames (row take) that callers may modify in place.
     """
     max_date = df[DATE_COL].max()
     cutoff_date = max_date - pd.DateOffset(months=n_val_periods)
 
-    train_df = df[df[DATE_COL] < cutoff_date].copy()
-    test_df = df[df[DATE_COL] >= cutoff_date].copy()
+    is_train = (df[DATE_COL] < cutoff_date).to_numpy()
+    train_df = df.take(np.flatnonzero(is_train))
+    test_df = df.take(np.flatnonzero(~is_train))
 
     return train_df, test_df
 
-def encode_data(df: pd.DataFrame, encoder: OrdinalEncoder = None
-            ) -> tuple[pd.DataFrame, OrdinalEncoder]:
-    """Encode categorical key columns.
+def _known_codes(series: pd.Series, categories: pd.Index) -> np.ndarray:
+    """Codes of series in categories, -1 for unknown labels.
+
+    A categorical series is recoded through its categories only; other
+    dtypes go through a hash lookup of every row.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.Categorical(series, categories=categories).codes
+    return categories.get_indexer(series)
+
+def encode_data(df: pd.DataFrame, encoder: dict[str, pd.Index] = None
+            ) -> tuple[pd.DataFrame, dict[str, pd.Index]]:
+    """Encode categorical key columns as int32 codes.
+
+    The encoder maps each key column to the sorted index of its known labels.
+    The key columns of df are replaced in place and df is returned.
     """
-    df = df.copy()
     if encoder is None:
-        encoder = OrdinalEncoder()
-        df[KEY_COLS] = encoder.fit_transform(df[KEY_COLS])
+        encoder = {}
+        for col in KEY_COLS:
+            codes, uniques = pd.factorize(df[col], sort=True)
+            df[col] = codes.astype("int32")
+            encoder[col] = pd.Index(uniques, dtype=object)
     else:
-        df[KEY_COLS] = encoder.transform(df[KEY_COLS])
+        for col in KEY_COLS:
+            codes = _known_codes(df[col], encoder[col])
+            if (codes < 0).any():
+                raise ValueError(f"Found unknown categories in column '{col}'.")
+            df[col] = codes.astype("int32")
 
     return df, encoder
 
+def decode_data(df: pd.DataFrame, encoder: dict[str, pd.Index]) -> pd.DataFrame:
+    """Decode key columns back to their original labels (in place).
+    """
+    for col in KEY_COLS:
+        df[col] = encoder[col].take(df[col].to_numpy()).to_numpy()
+
+    return df
+
+def to_categorical(df: pd.DataFrame, encoder: dict[str, pd.Index]) -> pd.DataFrame:
+    """Return a frame whose encoded key columns are categoricals over all codes.
+
+    Used for models with native categorical splits (HistGradientBoosting,
+    XGBoost, LightGBM). The categories come from the encoder, so train and
+    test share the same ones.
+    """
+    return df.assign(**{
+        col: pd.Categorical(df[col], categories=range(len(encoder[col])))
+        for col in KEY_COLS
+    })
+
+def save_encoder(encoder: dict[str, pd.Index], path: str) -> None:
+    """Save the encoder as JSON (list of known labels per key column).
+    """
+    filepath = Path(path)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump({col: labels.tolist() for col, labels in encoder.items()}, f)
+
+def _read_encoder(path: str) -> dict[str, pd.Index]:
+    """Read an encoder file written by save_encoder."""
+    with open(path, encoding="utf-8") as f:
+        labels = json.load(f)
+    return {col: pd.Index(values, dtype=object) for col, values in labels.items()}
+
+def load_encoder(path: str) -> dict[str, pd.Index]:
+    """Load an encoder saved by save_encoder.
+
+    The result is cached until the file changes and must not be modified.
+    """
+    return load_cached(path, _read_encoder, "Encoder")
+
 def save_data(df: pd.DataFrame, path: str) -> None:
-    """Save DataFrame to CSV file.
+    """Save DataFrame to a Parquet or CSV file (dispatch on suffix).
     """
     filepath = Path(path)
     filepath.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(filepath, index=False)
+    if filepath.suffix == ".parquet":
+        df.to_parquet(filepath, engine="pyarrow", compression="zstd", index=False)
+    else:
+        df.to_csv(filepath, index=False)
@@ -2,48 +2,92 @@
 @author: Joseph A.
 Description: Feature engineering module.
 """
+import numpy as np
 import pandas as pd
 from src.configs.config import KEY_COLS, TARGET_COL
 
 def add_date_features(df: pd.DataFrame) -> pd.DataFrame:
-    """ Add calendar-based features from a date column.
+    """ Add int16 calendar features from a date column (in place).
+    They are nullable Int16 when some dates are missing.
     """
-    df = df.copy()
+    if df['date'].hasnans:
+        df['year'] = df['date'].dt.year.astype('Int16')
+        df['month'] = df['date'].dt.month.astype('Int16')
+        df['quarter'] = df['date'].dt.quarter.astype('Int16')
+        return df
 
-    df['year'] = df['date'].dt.year
-    df['month'] = df['date'].dt.month
-    df['quarter'] = df['date'].dt.quarter
+    # One pass over the dates: months since 1970-01, then integer arithmetic.
+    months = df['date'].to_numpy().astype('datetime64[M]').astype(np.int32)
+    year, month = np.divmod(months, 12)
+    year = (year + 1970).astype(np.int16)
+    month = (month + 1).astype(np.int16)
+    df['year'] = year
+    df['month'] = month
+    df['quarter'] = (month - 1) // 3 + 1
 
     return df
 
-def add_lag_features(df: pd.DataFrame, lags: list[int]) -> pd.DataFrame:
-    """Add lag features to the DataFrame.
-    """
-    df = df.copy()
+def _group_order(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray | None]:
+    """Group codes of KEY_COLS and a stable sort making groups contiguous (or None)."""
+    codes = df.groupby(KEY_COLS, sort=False, observed=True).ngroup().to_numpy()
+    n_groups = codes.max() + 1 if len(codes) else 0
+    if np.count_nonzero(codes[1:] != codes[:-1]) == max(n_groups - 1, 0):
+        return codes, None
+    return codes, np.argsort(codes, kind="stable")
+
+def _shift_within_groups(values: np.ndarray, codes: np.ndarray, lag: int) -> np.ndarray:
+    """Shift values by lag rows within groups, like groupby.shift."""
+    if lag == 0:
+        return values.copy()
+    out = np.full(len(values), np.nan, dtype=values.dtype)
+    k = abs(lag)
+    if k < len(values):
+        same = codes[k:] == codes[:-k]
+        if lag > 0:
+            out[k:] = np.where(same, values[:-k], np.nan)
+        else:
+            out[:-k] = np.where(same, values[k:], np.nan)
+    return out
+
+def add_lag_and_rolling_features(df: pd.DataFrame, lags: list[int],
+                                windows: list[int]) -> pd.DataFrame:
+    """Add lag and rolling mean features to the DataFrame (in place)."""
+    codes, order = _group_order(df)
+    target = df[TARGET_COL]
+    values = target.to_numpy(dtype=np.result_type(target.dtype, np.float32))
+    if order is not None:
+        codes, values = codes[order], values[order]
+
+    def shifted(lag: int) -> np.ndarray:
+        out = _shift_within_groups(values, codes, lag)
+        if order is None:
+            return out
+        restored = np.empty_like(out)
+        restored[order] = out
+        return restored
+
+    lagged = {lag: shifted(lag) for lag in set(lags) | ({1} if windows else set())}
     for lag in lags:
-        df[f'{TARGET_COL}_lag_{lag}'] = df.groupby(KEY_COLS)[TARGET_COL].shift(lag)
-    return df
+        df[f'{TARGET_COL}_lag_{lag}'] = lagged[lag]
 
-def add_rolling_mean_features(df: pd.DataFrame, windows: list[int]) -> pd.DataFrame:
-    """Add rolling mean features to the DataFrame.
-    """
-    df = df.copy()
-    for window in windows:
-        df[f'{TARGET_COL}_rolling_mean_{window}'] = (
-            df.groupby(KEY_COLS)[TARGET_COL]
-            .shift(1)
-            .rolling(window)
-            .mean()
-        )
+    if windows:
+        lag_1 = pd.Series(lagged[1], index=df.index)
+        for window in windows:
+            df[f'{TARGET_COL}_rolling_mean_{window}'] = (
+                lag_1.rolling(window).mean().astype(np.float32)
+            )
     return df
 
 def build_features(df: pd.DataFrame, lags: list[int],
-                windows: list[int]) -> pd.DataFrame:
+                windows: list[int], inplace: bool = False) -> pd.DataFrame:
     """Feature engineering pipeline.
+
+    The frame is copied once up front unless inplace is True; the helpers
+    then add their columns to that frame.
     """
-    df = df.copy()
+    if not inplace:
+        df = df.copy()
     df = add_date_features(df)
-    df = add_lag_features(df, lags)
-    df = add_rolling_mean_features(df, windows)
+    df = add_lag_and_rolling_features(df, lags, windows)
 
     return df
@@ -2,24 +2,52 @@
 @author: Joseph A.
 Description: Inference module for sales forecasting.
 """
-from pathlib import Path
+import os
 import joblib
+import numpy as np
 import pandas as pd
+from lightgbm import Booster, LGBMRegressor
+from xgboost import XGBRegressor
+from src.data.loader import load_cached
 
 #pylint: disable=C0103:invalid-name
 
 def load_model(model_path: str):
     """Load trained model from pickle file.
+
+    Loaded models are cached, so repeated calls return the same object until
+    the file changes on disk. Fitted models are only read when predicting.
+    """
+    return load_cached(model_path, joblib.load, "Model")
+
+def predict_values(model, X: pd.DataFrame, n_jobs: int = -1) -> np.ndarray:
+    """Predict from a feature frame in one batch.
+    n_jobs sets the LightGBM prediction threads (-1: all cores).
     """
-    filepath = Path(model_path)
-    if not filepath.exists():
-        raise FileNotFoundError(f"Model not found: {model_path}")
-    return joblib.load(filepath)
+    if isinstance(model, (Booster, LGBMRegressor, XGBRegressor)):
+        X_arr = X.to_numpy(dtype=np.float32)
+        if isinstance(model, XGBRegressor):
+            return model.get_booster().inplace_predict(X_arr)
+        booster = model if isinstance(model, Booster) else model.booster_
+        num_threads = os.cpu_count() if n_jobs < 0 else n_jobs
+        # LightGBM needs a row-major matrix
+        return booster.predict(np.ascontiguousarray(X_arr), num_threads=num_threads)
+
+    # Other sklearn estimators validate feature names on the frame itself
+    return model.predict(X)
 
-def predict(model, df: pd.DataFrame, feature_cols: list) -> pd.DataFrame:
-    """Generate predictions using trained model.
+def predict(model, df: pd.DataFrame, feature_cols: list,
+            clip_min: float = None) -> pd.DataFrame:
+    """Add a prediction column to df (in place), clipped below at clip_min.
     """
-    df = df.copy()
-    X = df[feature_cols]
-    df["prediction"] = model.predict(X)
+    positions = df.columns.get_indexer(feature_cols)
+    if (positions < 0).any():
+        missing = [col for col, pos in zip(feature_cols, positions) if pos < 0]
+        raise ValueError(f"Missing feature columns: {missing}")
+    X = df.take(positions, axis=1)
+    y_pred = predict_values(model, X)
+    if clip_min is not None:
+        # Clip the prediction buffer, not the column (read-only under CoW)
+        np.maximum(y_pred, clip_min, out=y_pred)
+    df["prediction"] = y_pred
     return df
@@ -2,25 +2,50 @@
 @author: Joseph A.
 Description: Evaluation module.
 """
+import sys
+from dataclasses import dataclass
+import numpy as np
 import pandas as pd
-from sklearn.metrics import (
-    mean_absolute_error,
-    mean_absolute_percentage_error,
-    root_mean_squared_error
-)
+from src.inference.predictor import predict_values
 
 #pylint: disable=C0103:invalid-name
 
-def evaluate_model(model, X_val: pd.DataFrame, y_val: pd.Series) -> dict:
+# float64 machine epsilon, as used by sklearn's MAPE
+EPSILON = sys.float_info.epsilon
+
+@dataclass(frozen=True, slots=True)
+class Metrics:
+    """Regression metrics of a model on a validation set."""
+    mae: float
+    rmse: float
+    mape: float
+
+def calculate_all_metrics(y_true, y_pred) -> Metrics:
+    """Compute MAE, RMSE and MAPE from a single absolute-error array.
+
+    Same definitions as sklearn (MAPE divides by max(|y_true|, eps)).
+    """
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred)
+    # Inputs are cast to float64 inside the ufuncs, not copied beforehand
+    abs_err, scale = np.empty((2, y_true.size))
+
+    np.subtract(y_true, y_pred, out=abs_err, dtype=np.float64)
+    np.abs(abs_err, out=abs_err)
+    mae = abs_err.mean()
+    rmse = np.sqrt(np.dot(abs_err, abs_err) / abs_err.size)
+
+    np.abs(y_true, out=scale, dtype=np.float64)
+    np.maximum(scale, EPSILON, out=scale)
+    np.divide(abs_err, scale, out=scale)
+    mape = scale.mean()
+
+    return Metrics(mae=float(mae), rmse=float(rmse), mape=float(mape))
+
+def evaluate_model(model, X_val: pd.DataFrame, y_val: pd.Series,
+                n_jobs: int = -1) -> Metrics:
     """Evaluate model performance on validation set.
+    n_jobs sets the number of prediction threads (-1: all cores).
     """
-    y_pred = model.predict(X_val)
-    mae = mean_absolute_error(y_val, y_pred)
-    rmse = root_mean_squared_error(y_val, y_pred)
-    mape = mean_absolute_percentage_error(y_val, y_pred)
-
-    return {
-        "mae": mae,
-        "rmse": rmse,
-        "mape": mape
-    }
+    y_pred = predict_values(model, X_val, n_jobs=n_jobs)
+    return calculate_all_metrics(y_val, y_pred)
@@ -2,21 +2,50 @@
 @author: Joseph A.
 Description: Model training module.
 """
+import hashlib
+import warnings
 from pathlib import Path
 import joblib
-from sklearn.ensemble import RandomForestRegressor
+import lightgbm as lgb
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingRegressor
 from xgboost import XGBRegressor
 from lightgbm import LGBMRegressor
 
-def train_model(model_name: str, random_state: int = 42):
+#pylint: disable=C0103:invalid-name
+
+# LightGBM hyperparameters, shared by the sklearn wrapper and lgb.train
+# (LightGBM accepts the sklearn names as aliases)
+LGBM_PARAMS = {
+    "n_estimators": 500,
+    "learning_rate": 0.05,
+    "num_leaves": 31,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+}
+
+# HistGradientBoosting bins; it rejects categoricals with more levels than this
+HGB_MAX_BINS = 255
+
+def train_model(model_name: str, random_state: int = 42, n_jobs: int = -1):
     """ Initialize and return a regression model based on the specified model name.
+    n_jobs sets the number of threads used by the model (-1: all cores);
+    HistGradientBoosting takes its threads from OpenMP instead.
+    "random_forest" is a deprecated alias of "hist_gradient_boosting".
     """
     if model_name == "random_forest":
-        model = RandomForestRegressor(
-            n_estimators=300,
+        warnings.warn('"random_forest" is deprecated, use "hist_gradient_boosting"',
+                    DeprecationWarning, stacklevel=2)
+        model_name = "hist_gradient_boosting"
+
+    if model_name == "hist_gradient_boosting":
+        model = HistGradientBoostingRegressor(
+            max_iter=300,
             max_depth=12,
-            random_state=random_state,
-            n_jobs=-1
+            max_bins=HGB_MAX_BINS,
+            early_stopping=True,
+            categorical_features="from_dtype",
+            random_state=random_state
         )
 
     elif model_name == "xgboost":
@@ -27,23 +56,76 @@ def train_model(model_name: str, random_state: int = 42):
             subsample=0.8,
             colsample_bytree=0.8,
             objective="reg:squarederror",
+            enable_categorical=True,
             random_state=random_state,
-            n_jobs=-1)
+            n_jobs=n_jobs)
 
     elif model_name == "lightgbm":
         model = LGBMRegressor(
-            n_estimators=500,
-            learning_rate=0.05,
-            num_leaves=31,
-            subsample=0.8,
-            colsample_bytree=0.8,
-            random_state=random_state
+            **LGBM_PARAMS,
+            random_state=random_state,
+            n_jobs=n_jobs
         )
     else:
         raise ValueError(f"Unsupported model name: {model_name}")
 
     return model
 
+def limit_categorical_levels(X: pd.DataFrame, max_levels: int) -> pd.DataFrame:
+    """Replace categoricals with more than max_levels categories by their codes.
+    """
+    wide = [col for col in X.columns
+            if isinstance(X[col].dtype, pd.CategoricalDtype)
+            and len(X[col].cat.categories) > max_levels]
+    if not wide:
+        return X
+    return X.assign(**{col: X[col].cat.codes.astype("int32") for col in wide})
+
+def _fingerprint(X: pd.DataFrame, y: pd.Series) -> str:
+    """Hash the content, column names and dtypes of a training set.
+    """
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+    digest.update(repr(list(zip(X.columns, X.dtypes.astype(str)))).encode())
+    return digest.hexdigest()
+
+def build_lgb_dataset(X: pd.DataFrame, y: pd.Series, categorical_feature: list[str],
+                    cache_path: str | Path, params: dict = None) -> lgb.Dataset:
+    """Build a LightGBM Dataset, reusing its binary file for the same data.
+
+    The binary holds the bin mappers, so reloading it skips bin construction.
+    A key kept in `<cache_path>.key` detects stale files: it covers X/y, the
+    categorical features, the Dataset and model params and the LightGBM
+    version (a binary does not apply categorical_feature or params again).
+    """
+    cache_path = Path(cache_path)
+    key_path = cache_path.with_name(cache_path.name + ".key")
+    digest = hashlib.sha1(_fingerprint(X, y).encode())
+    digest.update(repr((list(categorical_feature), sorted((params or {}).items()),
+                        sorted(LGBM_PARAMS.items()), lgb.__version__)).encode())
+    key = digest.hexdigest()
+
+    if (cache_path.exists() and key_path.exists()
+            and key_path.read_text(encoding="utf-8") == key):
+        return lgb.Dataset(str(cache_path), params=params)
+
+    train_set = lgb.Dataset(X, y, categorical_feature=categorical_feature,
+                            params=params, free_raw_data=False)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    train_set.save_binary(str(cache_path))
+    key_path.write_text(key, encoding="utf-8")
+    return train_set
+
+def train_lgb_booster(train_set: lgb.Dataset, random_state: int = 42,
+                    n_jobs: int = -1) -> lgb.Booster:
+    """Train LightGBM on a prebuilt Dataset (same model as train_model("lightgbm")).
+    """
+    params = {"objective": "regression", **LGBM_PARAMS,
+            "random_state": random_state, "n_jobs": n_jobs}
+    num_boost_round = params.pop("n_estimators")
+    return lgb.train(params, train_set, num_boost_round=num_boost_round)
+
 def save_model(model, path: str) -> None:
     """Save trained model to pickle file.
     """